@@ -1,16 +1,63 @@
 import os
 import sqlite3
 import uuid
-import qrcode
 import io
 import csv
-from datetime import datetime
-from flask import Flask, render_template, request, jsonify, send_file
+import json
+import multiprocessing
+import re
+import threading
+import time
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from flask import Flask, render_template, request, jsonify, send_file, session
+from PIL import Image, ImageDraw, ImageFont
+from qr_render import render_qr
 
 app = Flask(__name__)
 
+# Ключ подписи cookie сессии студента из переменной окружения SECRET_KEY.
+# Без нее используется общеизвестный ключ разработки: cookie с ним можно подделать
+app.secret_key = os.environ.get('SECRET_KEY') or 'dev-attendance-secret-key'
+# Студенту из cookie доверяем без проверки по БД только при настоящем ключе
+SESSION_TRUSTED = bool(os.environ.get('SECRET_KEY'))
+if 'RENDER' in os.environ and not SESSION_TRUSTED:
+    print("⚠️ SECRET_KEY не задан: студент из cookie каждый раз проверяется по БД")
+# Студент выбирает себя один раз за семестр
+app.permanent_session_lifetime = timedelta(days=180)
+# Срок считается от выбора студента: cookie не переподписывается на каждой отметке
+app.config['SESSION_REFRESH_EACH_REQUEST'] = False
+
+# Через сколько минут после начала отметка считается опозданием
+LATE_AFTER_MINUTES = int(os.environ.get('LATE_AFTER_MINUTES', 15))
+# Через сколько минут после начала занятие закрывается автоматически
+CLOSE_AFTER_MINUTES = int(os.environ.get('CLOSE_AFTER_MINUTES', 90))
+# Период проверки занятий фоновым планировщиком (секунды)
+AUTO_CLOSE_INTERVAL = int(os.environ.get('AUTO_CLOSE_INTERVAL', 60))
+# Пауза между закрытием занятий (секунды), чтобы не задерживать отметки студентов
+CLOSE_PAUSE = 0.1
+
+# Часовой пояс колледжа: время занятий вводится по местному времени,
+# а сервер (Render) работает в UTC
+TIMEZONE = ZoneInfo(os.environ.get('TIMEZONE', 'Europe/Moscow'))
+
+def local_now():
+    """Текущее местное время колледжа (без tzinfo, как и время занятий в БД)"""
+    return datetime.now(TIMEZONE).replace(tzinfo=None)
+
 # ================== БАЗА ДАННЫХ ==================
 
+def search_normalize(text):
+    """Нормализация текста для поиска: ё и е не различаются"""
+    return text.replace('ё', 'е').replace('Ё', 'Е')
+
+def search_normalize_sql(expression):
+    """То же, что search_normalize, но в виде SQL-выражения для триггеров"""
+    return f"replace(replace({expression}, 'ё', 'е'), 'Ё', 'Е')"
+
 def init_db():
     """Инициализация базы данных"""
     # На Render используем /tmp папку, локально - текущую папку
@@ -24,6 +71,9 @@ def init_db():
     conn = sqlite3.connect(db_path)
     c = conn.cursor()
     
+    # WAL: читатели не блокируют запись журнала отметок
+    c.execute("PRAGMA journal_mode=WAL")
+    
     # Таблица студентов (3 человека)
     c.execute('''CREATE TABLE IF NOT EXISTS students
                  (id INTEGER PRIMARY KEY, 
@@ -35,7 +85,13 @@ def init_db():
                  (id INTEGER PRIMARY KEY AUTOINCREMENT,
                   subject TEXT NOT NULL,
                   date_time TEXT NOT NULL,
-                  qr_token TEXT UNIQUE)''')
+                  qr_token TEXT UNIQUE,
+                  closed_at TEXT)''')
+    
+    # Миграция: колонка closed_at для баз, созданных до автозакрытия занятий
+    c.execute("PRAGMA table_info(classes)")
+    if 'closed_at' not in [column[1] for column in c.fetchall()]:
+        c.execute("ALTER TABLE classes ADD COLUMN closed_at TEXT")
     
     # Таблица посещаемости
     c.execute('''CREATE TABLE IF NOT EXISTS attendance
@@ -45,6 +101,71 @@ def init_db():
                   scan_time TEXT,
                   PRIMARY KEY(student_id, class_id))''')
     
+    # Журнал событий посещаемости (только добавление записей).
+    # Таблица attendance - проекция последнего события по паре студент/занятие
+    c.execute('''CREATE TABLE IF NOT EXISTS attendance_events
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  student_id INTEGER NOT NULL,
+                  class_id INTEGER NOT NULL,
+                  status TEXT NOT NULL,
+                  scan_time TEXT,
+                  source TEXT NOT NULL,
+                  created_at TEXT NOT NULL)''')
+    c.execute('''CREATE INDEX IF NOT EXISTS idx_attendance_events_class
+                 ON attendance_events (class_id, student_id, id)''')
+    
+    # Переносим существующие отметки в журнал, чтобы replay их не потерял
+    c.execute("SELECT COUNT(*) FROM attendance_events")
+    if c.fetchone()[0] == 0:
+        c.execute('''INSERT INTO attendance_events
+                     (student_id, class_id, status, scan_time, source, created_at)
+                     SELECT student_id, class_id, status, scan_time, 'migration', ?
+                     FROM attendance''', (local_now().strftime('%Y-%m-%d %H:%M:%S'),))
+        if c.rowcount > 0:
+            print(f"✅ В журнал событий перенесено отметок: {c.rowcount}")
+    
+    # Сообщения для обмена событиями между воркерами (SQLite-брокер)
+    c.execute('''CREATE TABLE IF NOT EXISTS pubsub_messages
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  payload TEXT NOT NULL,
+                  created_at REAL NOT NULL)''')
+    
+    # Полнотекстовые индексы для поиска (unicode61 приводит к нижнему регистру и кириллицу).
+    # Индексы без хранения текста: в них пишется нормализованный текст (ё -> е)
+    c.execute("SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'students_fts'")
+    fts_exists = c.fetchone() is not None
+    
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS students_fts
+                 USING fts5(name, group_name, content='',
+                            tokenize='unicode61', prefix='2 3')''')
+    c.execute('''CREATE VIRTUAL TABLE IF NOT EXISTS classes_fts
+                 USING fts5(subject, content='',
+                            tokenize='unicode61', prefix='2 3')''')
+    
+    # Триггеры поддерживают индексы в актуальном состоянии
+    for table, fts, columns in (('students', 'students_fts', ('name', 'group_name')),
+                                ('classes', 'classes_fts', ('subject',))):
+        column_list = ', '.join(columns)
+        new_values = ', '.join(search_normalize_sql(f'new.{column}') for column in columns)
+        old_values = ', '.join(search_normalize_sql(f'old.{column}') for column in columns)
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_fts_insert AFTER INSERT ON {table} BEGIN
+                          INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+                      END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_fts_delete AFTER DELETE ON {table} BEGIN
+                          INSERT INTO {fts} ({fts}, rowid, {column_list})
+                          VALUES ('delete', old.id, {old_values});
+                      END''')
+        c.execute(f'''CREATE TRIGGER IF NOT EXISTS {table}_fts_update AFTER UPDATE OF {column_list} ON {table} BEGIN
+                          INSERT INTO {fts} ({fts}, rowid, {column_list})
+                          VALUES ('delete', old.id, {old_values});
+                          INSERT INTO {fts} (rowid, {column_list}) VALUES (new.id, {new_values});
+                      END''')
+        
+        # Индекс создан для уже заполненной базы - строим его по существующим данным
+        if not fts_exists:
+            values = ', '.join(search_normalize_sql(column) for column in columns)
+            c.execute(f"INSERT INTO {fts} (rowid, {column_list}) SELECT id, {values} FROM {table}")
+    
     # Добавляем 3-х тестовых студентов
     c.execute("SELECT COUNT(*) FROM students")
     if c.fetchone()[0] == 0:
@@ -70,10 +191,389 @@ def get_db():
     
     conn = sqlite3.connect(db_path)
     conn.row_factory = sqlite3.Row  # Для доступа к колонкам по имени
+    # В режиме WAL NORMAL не делает fsync на каждый коммит, журнал остается целым при сбое
+    conn.execute("PRAGMA synchronous=NORMAL")
     return conn
 
-# Инициализируем БД при старте
-DB_PATH = init_db()
+SCAN_DB = threading.local()
+
+def get_scan_db():
+    """Постоянное соединение потока для отметок: схема (FTS, триггеры) разбирается один раз"""
+    conn = getattr(SCAN_DB, 'conn', None)
+    if conn is None:
+        conn = get_db()
+        SCAN_DB.conn = conn
+    return conn
+
+def record_event(c, student_id, class_id, status, scan_time, source, require_open=False):
+    """Запись события в журнал и обновление проекции attendance.
+    
+    Возвращает True, если у студента уже была отметка на этом занятии.
+    С require_open=True событие пишется только для незакрытого занятия,
+    иначе ничего не записывается и возвращается None.
+    """
+    created_at = local_now().strftime('%Y-%m-%d %H:%M:%S')
+    params = (student_id, class_id, status, scan_time, source, created_at)
+    open_filter = ""
+    if require_open:
+        # Проверка closed_at в той же транзакции: закрытие и отметка не перемешаются
+        open_filter = "WHERE EXISTS (SELECT 1 FROM classes WHERE id = ? AND closed_at IS NULL)"
+        params += (class_id,)
+    
+    c.execute(f'''INSERT INTO attendance_events
+                  (student_id, class_id, status, scan_time, source, created_at)
+                  SELECT ?, ?, ?, ?, ?, ?
+                  {open_filter}''', params)
+    if c.rowcount == 0:
+        return None
+    
+    # UPDATE по первичному ключу заодно сообщает, была ли запись - без отдельного SELECT
+    c.execute('''UPDATE attendance SET status = ?, scan_time = ?
+                 WHERE student_id = ? AND class_id = ?''',
+              (status, scan_time, student_id, class_id))
+    if c.rowcount > 0:
+        return True
+    
+    c.execute('''INSERT INTO attendance (student_id, class_id, status, scan_time)
+                 VALUES (?, ?, ?, ?)''',
+              (student_id, class_id, status, scan_time))
+    return False
+
+def rebuild_attendance(c, class_id=None):
+    """Пересборка проекции attendance из журнала событий"""
+    # Для каждой пары студент/занятие берется последнее событие
+    class_filter = "WHERE class_id = ?" if class_id is not None else ""
+    params = (class_id,) if class_id is not None else ()
+    
+    c.execute(f"DELETE FROM attendance {class_filter}", params)
+    c.execute(f'''INSERT INTO attendance (student_id, class_id, status, scan_time)
+                  SELECT e.student_id, e.class_id, e.status, e.scan_time
+                  FROM attendance_events e
+                  JOIN (SELECT MAX(id) AS id FROM attendance_events
+                        {class_filter}
+                        GROUP BY student_id, class_id) last ON last.id = e.id''', params)
+    return c.rowcount
+
+# Занятия по токену QR-кода: токен не меняется, поэтому кэш сбрасывается только при удалении
+CLASS_BY_TOKEN = {}
+
+def get_class_by_token(token):
+    """Занятие по токену QR-кода (id, subject, date_time) или None"""
+    if token in CLASS_BY_TOKEN:
+        return CLASS_BY_TOKEN[token]
+    
+    conn = get_db()
+    c = conn.cursor()
+    c.execute("SELECT id, subject, date_time FROM classes WHERE qr_token = ?", (token,))
+    class_data = c.fetchone()
+    conn.close()
+    
+    if not class_data:
+        return None
+    CLASS_BY_TOKEN[token] = dict(class_data)
+    return CLASS_BY_TOKEN[token]
+
+# ================== ЗАКРЫТИЕ ЗАНЯТИЙ ==================
+
+# Закрытые занятия: id -> токен. Отметки по этим токенам отклоняются без запроса к БД
+CLOSED_CLASSES = {}
+CLOSED_TOKENS = set()
+
+# Итоговая посещаемость закрытых занятий (после закрытия она не меняется сама).
+# Хранятся только недавно просмотренные занятия: у каждого итог на весь список студентов
+CLOSED_ATTENDANCE = OrderedDict()
+CLOSED_ATTENDANCE_MAX = int(os.environ.get('CLOSED_ATTENDANCE_MAX', 20))
+# Растет при каждом сбросе кэша: итог, прочитанный до сброса, в кэш не попадает
+CLOSED_ATTENDANCE_VERSION = 0
+CLOSED_ATTENDANCE_LOCK = threading.Lock()
+
+def invalidate_closed_attendance(class_ids=None):
+    """Сброс итогов занятий из кэша (всех, если class_ids не указан)"""
+    global CLOSED_ATTENDANCE_VERSION
+    with CLOSED_ATTENDANCE_LOCK:
+        CLOSED_ATTENDANCE_VERSION += 1
+        if class_ids is None:
+            CLOSED_ATTENDANCE.clear()
+        for class_id in class_ids or ():
+            CLOSED_ATTENDANCE.pop(class_id, None)
+
+def load_closed_classes(c):
+    """Обновление списка закрытых занятий из БД"""
+    global CLOSED_CLASSES, CLOSED_TOKENS
+    c.execute("SELECT id, qr_token FROM classes WHERE closed_at IS NOT NULL")
+    closed = {row[0]: row[1] for row in c.fetchall()}
+    reopened = set(CLOSED_ATTENDANCE) - set(closed)
+    if reopened:
+        invalidate_closed_attendance(reopened)
+    # Новые наборы подменяются целиком, чтобы проверка отметки не увидела пустой набор
+    CLOSED_CLASSES = closed
+    CLOSED_TOKENS = set(closed.values())
+
+def close_class(c, class_id, start_time):
+    """Закрытие занятия: итоговые статусы absent/late для всего списка студентов"""
+    now = local_now().strftime('%Y-%m-%d %H:%M:%S')
+    
+    # Закрывает только один воркер, остальные увидят closed_at
+    c.execute("UPDATE classes SET closed_at = ? WHERE id = ? AND closed_at IS NULL",
+              (now, class_id))
+    if c.rowcount == 0:
+        return False
+    
+    late_deadline = (start_time + timedelta(minutes=LATE_AFTER_MINUTES)).strftime('%Y-%m-%d %H:%M:%S')
+    
+    # Одним запросом пишем в журнал absent для неотметившихся и late для опоздавших.
+    # Опоздание ставится только по сканированию: исправления преподавателя не трогаем
+    c.execute('''INSERT INTO attendance_events
+                 (student_id, class_id, status, scan_time, source, created_at)
+                 SELECT s.id, ?,
+                        CASE WHEN a.status IS NULL THEN 'absent' ELSE 'late' END,
+                        a.scan_time, 'auto_close', ?
+                 FROM students s
+                 LEFT JOIN attendance a ON s.id = a.student_id AND a.class_id = ?
+                 LEFT JOIN attendance_events e ON e.id =
+                     (SELECT MAX(id) FROM attendance_events
+                      WHERE class_id = ? AND student_id = s.id)
+                 WHERE a.status IS NULL
+                    OR (a.status = 'present' AND e.source = 'scan' AND a.scan_time > ?)''',
+              (class_id, now, class_id, class_id, late_deadline))
+    rebuild_attendance(c, class_id)
+    return True
+
+def close_due_classes():
+    """Закрытие всех занятий, у которых истекло окно отметки"""
+    conn = get_db()
+    c = conn.cursor()
+    
+    c.execute("SELECT id, date_time, qr_token FROM classes WHERE closed_at IS NULL")
+    now = local_now()
+    closed = {}
+    for row in c.fetchall():
+        try:
+            start_time = datetime.fromisoformat(row['date_time'])
+        except ValueError:
+            continue
+        if now >= start_time + timedelta(minutes=CLOSE_AFTER_MINUTES):
+            # Коммит после каждого занятия: при большом списке студентов закрытие всех
+            # занятий одной транзакцией держало бы блокировку дольше таймаута отметок
+            is_closed = close_class(c, row['id'], start_time)
+            conn.commit()
+            if is_closed:
+                closed[row['id']] = row['qr_token']
+                # Ожидающие отметки (повтор каждые 100 мс) успевают захватить блокировку
+                time.sleep(CLOSE_PAUSE)
+    
+    load_closed_classes(c)
+    conn.close()
+    
+    if closed:
+        publish_event('classes_closed', {'classes': closed})
+    for class_id in closed:
+        print(f"🔒 Занятие ID {class_id} закрыто, итоговая посещаемость записана")
+    return list(closed)
+
+def auto_close_loop():
+    """Фоновый планировщик закрытия занятий"""
+    while True:
+        try:
+            close_due_classes()
+        except Exception as e:
+            print(f"❌ Ошибка автозакрытия занятий: {str(e)}")
+        time.sleep(AUTO_CLOSE_INTERVAL)
+
+def fetch_attendance(c, class_id):
+    """Посещаемость занятия; для закрытых занятий - из кэша без LEFT JOIN"""
+    with CLOSED_ATTENDANCE_LOCK:
+        if class_id in CLOSED_ATTENDANCE:
+            CLOSED_ATTENDANCE.move_to_end(class_id)
+            return CLOSED_ATTENDANCE[class_id]
+        version = CLOSED_ATTENDANCE_VERSION
+    
+    if class_id in CLOSED_CLASSES:
+        # У закрытого занятия статус есть у каждого студента
+        c.execute('''SELECT s.id, s.name, s.group_name, a.status, a.scan_time
+                     FROM attendance a
+                     JOIN students s ON s.id = a.student_id
+                     WHERE a.class_id = ?
+                     ORDER BY s.group_name, s.name''', (class_id,))
+        attendance = [dict(row) for row in c.fetchall()]
+        
+        with CLOSED_ATTENDANCE_LOCK:
+            # Пока шел запрос, итог могли исправить - такой результат уже устарел
+            if version == CLOSED_ATTENDANCE_VERSION:
+                CLOSED_ATTENDANCE[class_id] = attendance
+                if len(CLOSED_ATTENDANCE) > CLOSED_ATTENDANCE_MAX:
+                    CLOSED_ATTENDANCE.popitem(last=False)
+        return attendance
+    
+    c.execute('''SELECT s.id, s.name, s.group_name, 
+                        COALESCE(a.status, 'absent') as status,
+                        a.scan_time
+                 FROM students s
+                 LEFT JOIN attendance a ON s.id = a.student_id AND a.class_id = ?
+                 ORDER BY s.group_name, s.name''', (class_id,))
+    return [dict(row) for row in c.fetchall()]
+
+# ================== ОБМЕН СОБЫТИЯМИ МЕЖДУ ВОРКЕРАМИ ==================
+
+# Идентификатор процесса: свои сообщения из брокера повторно не обрабатываются
+WORKER_ID = uuid.uuid4().hex
+
+# redis://... - брокер Redis для нескольких хостов, иначе - SQLite на одном хосте
+PUBSUB_URL = os.environ.get('PUBSUB_URL', '')
+# Период опроса таблицы сообщений SQLite-брокером (секунды)
+PUBSUB_POLL_INTERVAL = float(os.environ.get('PUBSUB_POLL_INTERVAL', 0.1))
+# Сколько секунд хранятся сообщения в SQLite-брокере
+PUBSUB_RETENTION = 60
+
+class SQLiteBroker:
+    """Брокер сообщений на таблице SQLite (воркеры gunicorn на одном хосте)"""
+    
+    def publish(self, payload):
+        conn = get_db()
+        conn.execute("INSERT INTO pubsub_messages (payload, created_at) VALUES (?, ?)",
+                     (payload, time.time()))
+        conn.commit()
+        conn.close()
+    
+    def listen(self, handler):
+        conn = get_db()
+        # Читаем только сообщения, опубликованные после запуска воркера
+        last_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM pubsub_messages").fetchone()[0]
+        last_cleanup = time.time()
+        
+        while True:
+            rows = conn.execute("SELECT id, payload FROM pubsub_messages WHERE id > ? ORDER BY id",
+                                (last_id,)).fetchall()
+            for row in rows:
+                last_id = row['id']
+                handler(row['payload'])
+            
+            if time.time() - last_cleanup > PUBSUB_RETENTION:
+                last_cleanup = time.time()
+                conn.execute("DELETE FROM pubsub_messages WHERE created_at < ?",
+                             (last_cleanup - PUBSUB_RETENTION,))
+                conn.commit()
+            
+            time.sleep(PUBSUB_POLL_INTERVAL)
+
+class RedisBroker:
+    """Брокер сообщений на Redis Pub/Sub (несколько экземпляров приложения)"""
+    
+    CHANNEL = 'attendance_system'
+    
+    def __init__(self, url):
+        # Redis нужен только при PUBSUB_URL=redis://..., поэтому не в requirements.txt
+        import redis
+        self.client = redis.Redis.from_url(url)
+    
+    def publish(self, payload):
+        self.client.publish(self.CHANNEL, payload)
+    
+    def listen(self, handler):
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(self.CHANNEL)
+        for message in pubsub.listen():
+            handler(message['data'])
+
+def on_class_deleted(data):
+    """Удаленное занятие убирается из кэшей закрытых занятий"""
+    class_id = data['class_id']
+    CLOSED_TOKENS.discard(CLOSED_CLASSES.pop(class_id, None))
+    invalidate_closed_attendance([class_id])
+    for token, class_data in list(CLASS_BY_TOKEN.items()):
+        if class_data['id'] == class_id:
+            CLASS_BY_TOKEN.pop(token, None)
+
+def on_classes_closed(data):
+    """Закрытые другим воркером занятия сразу отклоняют отметки"""
+    for class_id, qr_token in data['classes'].items():
+        CLOSED_CLASSES[int(class_id)] = qr_token
+        CLOSED_TOKENS.add(qr_token)
+
+def on_attendance(data):
+    """Исправление преподавателя сбрасывает итог закрытого занятия.
+    
+    Отметки студентов не рассылаются: они возможны только для открытых занятий,
+    у которых нет кэша итогов, а лишняя запись в брокер удваивала бы цену отметки.
+    """
+    invalidate_closed_attendance([data['class_id']])
+
+def on_attendance_replayed(data):
+    """После пересборки проекции из журнала все итоги закрытых занятий устарели"""
+    invalidate_closed_attendance()
+
+# Обработчики событий: рассылаются только события, у которых есть обработчик
+PUBSUB_HANDLERS = {
+    'class_deleted': on_class_deleted,
+    'classes_closed': on_classes_closed,
+    'attendance': on_attendance,
+    'attendance_replayed': on_attendance_replayed,
+}
+
+PUBSUB_BROKER = RedisBroker(PUBSUB_URL) if PUBSUB_URL.startswith('redis') else SQLiteBroker()
+
+def publish_event(event, data):
+    """Применение события в текущем воркере и рассылка остальным"""
+    handler = PUBSUB_HANDLERS.get(event)
+    if handler:
+        handler(data)
+    
+    payload = json.dumps({'event': event, 'data': data, 'origin': WORKER_ID,
+                          'sent_at': time.time()})
+    try:
+        PUBSUB_BROKER.publish(payload)
+    except Exception as e:
+        # Остальные воркеры догонят состояние по БД при следующем автозакрытии
+        print(f"❌ Ошибка публикации события {event}: {str(e)}")
+
+def handle_message(payload):
+    """Обработка сообщения от другого воркера"""
+    try:
+        message = json.loads(payload)
+        if message['origin'] == WORKER_ID:
+            return
+        handler = PUBSUB_HANDLERS.get(message['event'])
+        if handler:
+            handler(message['data'])
+    except Exception as e:
+        print(f"❌ Ошибка обработки события: {str(e)}")
+
+def pubsub_loop():
+    """Фоновый подписчик на события других воркеров"""
+    while True:
+        try:
+            PUBSUB_BROKER.listen(handle_message)
+        except Exception as e:
+            print(f"❌ Ошибка подписки на события: {str(e)}")
+            time.sleep(1)
+
+# Процессы пула QR-кодов при запуске через python app.py загружают этот файл
+# как __mp_main__ - им не нужны ни БД, ни фоновые потоки
+if __name__ != '__mp_main__':
+    # Инициализируем БД при старте
+    DB_PATH = init_db()
+    
+    # Загружаем список закрытых занятий
+    startup_conn = get_db()
+    load_closed_classes(startup_conn.cursor())
+    startup_conn.close()
+    
+    if os.environ.get('AUTO_CLOSE_ENABLED', '1') == '1':
+        threading.Thread(target=auto_close_loop, daemon=True).start()
+    
+    threading.Thread(target=pubsub_loop, daemon=True).start()
+
+@app.cli.command('replay-attendance')
+def replay_attendance():
+    """Пересборка таблицы attendance из журнала событий: flask replay-attendance"""
+    conn = get_db()
+    c = conn.cursor()
+    count = rebuild_attendance(c)
+    conn.commit()
+    conn.close()
+    # Запущенные воркеры сбрасывают итоги закрытых занятий, собранные до пересборки
+    publish_event('attendance_replayed', {})
+    print(f"✅ Проекция посещаемости пересобрана, записей: {count}")
 
 # ================== ГЛАВНЫЕ СТРАНИЦЫ ==================
 
@@ -98,12 +598,7 @@ def index():
         
         if classes:
             selected_class_id = classes[0]['id']
-            c.execute('''SELECT s.id, s.name, s.group_name, 
-                                COALESCE(a.status, 'absent') as status
-                         FROM students s
-                         LEFT JOIN attendance a ON s.id = a.student_id AND a.class_id = ?
-                         ORDER BY s.group_name, s.name''', (selected_class_id,))
-            attendance = c.fetchall()
+            attendance = fetch_attendance(c, selected_class_id)
         
         conn.close()
         
@@ -125,8 +620,16 @@ def scan():
     user_agent = request.headers.get('User-Agent', '').lower()
     is_mobile = any(word in user_agent for word in ['mobile', 'android', 'iphone'])
     
-    # Передаем токен в шаблон
-    return render_template('scan.html', is_mobile=is_mobile, token=token)
+    # Занятие определяется на сервере, чтобы страница не делала отдельный запрос проверки токена
+    class_info = get_class_by_token(token) if token else None
+    class_closed = token in CLOSED_TOKENS
+    
+    # Студент, уже отмечавшийся с этого устройства (подписанная cookie сессии)
+    student = session.get('student')
+    
+    return render_template('scan.html', is_mobile=is_mobile, token=token,
+                           class_info=class_info, class_closed=class_closed,
+                           student=student)
 
 # ================== API ДЛЯ ЗАНЯТИЙ ==================
 
@@ -175,8 +678,9 @@ def delete_class(class_id):
         conn = get_db()
         c = conn.cursor()
         
-        # Сначала удаляем связанную посещаемость
+        # Сначала удаляем связанную посещаемость и журнал событий
         c.execute("DELETE FROM attendance WHERE class_id = ?", (class_id,))
+        c.execute("DELETE FROM attendance_events WHERE class_id = ?", (class_id,))
         
         # Затем удаляем само занятие
         c.execute("DELETE FROM classes WHERE id = ?", (class_id,))
@@ -184,6 +688,8 @@ def delete_class(class_id):
         conn.commit()
         conn.close()
         
+        publish_event('class_deleted', {'class_id': class_id})
+        
         print(f"🗑️ Удалено занятие ID: {class_id}")
         
         return jsonify({
@@ -210,6 +716,104 @@ def get_classes():
 
 # ================== ГЕНЕРАЦИЯ QR-КОДОВ ==================
 
+# Кэш уже отрисованных QR-кодов: (ссылка, формат) -> байты изображения
+QR_CACHE = {}
+QR_CACHE_MAX = 2000
+
+# Пул процессов для пакетной генерации (создается при первом запросе)
+QR_POOL = None
+# Верхняя граница размера пула по умолчанию: пул есть в каждом воркере gunicorn
+QR_WORKERS_MAX = 4
+
+# Сколько занятий можно выгрузить одним запросом: весь архив собирается в памяти
+QR_BATCH_MAX = int(os.environ.get('QR_BATCH_MAX', 500))
+# Шрифт подписи на страницах PDF (встроенный шрифт Pillow не содержит кириллицы)
+QR_CAPTION_FONT = os.environ.get('QR_CAPTION_FONT', 'DejaVuSans.ttf')
+QR_CAPTION_SIZE = 22
+
+def get_base_url():
+    """Базовый URL для ссылок в QR-кодах"""
+    base_url = request.host_url.rstrip('/')
+    # На Render используем абсолютный URL
+    if 'RENDER' in os.environ:
+        # Если это localhost, заменяем на реальный URL Render
+        if 'localhost' in base_url or '127.0.0.1' in base_url:
+            base_url = 'https://attendance-system-rbif.onrender.com'
+    return base_url
+
+def get_qr_pool():
+    """Ленивое создание пула процессов для рендера QR-кодов"""
+    global QR_POOL
+    if QR_POOL is None:
+        if 'QR_WORKERS' in os.environ:
+            workers = int(os.environ['QR_WORKERS'])
+        else:
+            # Доступные процессу ядра (в контейнере cpu_count() - ядра хоста)
+            if hasattr(os, 'sched_getaffinity'):
+                cores = len(os.sched_getaffinity(0))
+            else:
+                cores = os.cpu_count() or 1
+            workers = min(cores, QR_WORKERS_MAX)
+        
+        # Воркер уже запустил фоновые потоки, поэтому процессы пула не форкаются
+        # от него, а создаются forkserver'ом, который загружает только qr_render
+        if 'forkserver' in multiprocessing.get_all_start_methods():
+            context = multiprocessing.get_context('forkserver')
+            context.set_forkserver_preload(['qr_render'])
+        else:
+            context = multiprocessing.get_context('spawn')
+        QR_POOL = ProcessPoolExecutor(max_workers=workers, mp_context=context)
+    return QR_POOL
+
+def get_caption_font():
+    """Шрифт подписи страниц PDF"""
+    try:
+        return ImageFont.truetype(QR_CAPTION_FONT, QR_CAPTION_SIZE)
+    except OSError:
+        print(f"❌ Шрифт {QR_CAPTION_FONT} не найден, подпись может быть без кириллицы")
+        return ImageFont.load_default(size=QR_CAPTION_SIZE)
+
+def make_qr_page(png, lines, font):
+    """Страница PDF: QR-код с подписью (предмет и время занятия) под ним"""
+    qr_image = Image.open(io.BytesIO(png)).convert('RGB')
+    margin = 20
+    line_height = QR_CAPTION_SIZE + 8
+    text_width = max(int(font.getlength(line)) for line in lines)
+    
+    width = max(qr_image.width, text_width + 2 * margin)
+    page = Image.new('RGB', (width, qr_image.height + line_height * len(lines) + margin), 'white')
+    page.paste(qr_image, ((width - qr_image.width) // 2, 0))
+    
+    draw = ImageDraw.Draw(page)
+    for number, line in enumerate(lines):
+        draw.text((width // 2, qr_image.height + number * line_height), line,
+                  font=font, fill='black', anchor='mt')
+    return page
+
+def get_qr_images(qr_items, image_format='png'):
+    """Получение QR-кодов из кэша, недостающие рендерятся параллельно"""
+    missing = [qr_data for qr_data in dict.fromkeys(qr_items)
+               if (qr_data, image_format) not in QR_CACHE]
+    
+    # Один QR-код дешевле отрисовать на месте, чем передавать в пул
+    if len(missing) == 1:
+        rendered = [render_qr(missing[0], image_format)]
+    elif missing:
+        rendered = get_qr_pool().map(render_qr, missing,
+                                     [image_format] * len(missing),
+                                     chunksize=max(1, len(missing) // 32))
+    else:
+        rendered = []
+    
+    images = {qr_data: QR_CACHE[(qr_data, image_format)]
+              for qr_data in qr_items if (qr_data, image_format) in QR_CACHE}
+    for qr_data, image in zip(missing, rendered):
+        images[qr_data] = image
+        if len(QR_CACHE) >= QR_CACHE_MAX:
+            QR_CACHE.clear()
+        QR_CACHE[(qr_data, image_format)] = image
+    return images
+
 @app.route('/api/generate_qr/<int:class_id>')
 def generate_qr(class_id):
     """Генерация QR-кода для занятия"""
@@ -220,52 +824,22 @@ def generate_qr(class_id):
         # Получаем занятие
         c.execute("SELECT * FROM classes WHERE id = ?", (class_id,))
         class_data = c.fetchone()
+        conn.close()
         
         if not class_data:
             return jsonify({'error': 'Занятие не найдено'}), 404
         
-        # Получаем токен занятия
-        qr_token = class_data['qr_token']
-        
-        # Создаем правильную ссылку для отметки
-        # На Render используем абсолютный URL
-        if 'RENDER' in os.environ:
-            # Получаем URL из запроса или используем дефолтный
-            base_url = request.host_url.rstrip('/')
-            # Если это localhost, заменяем на реальный URL Render
-            if 'localhost' in base_url or '127.0.0.1' in base_url:
-                base_url = 'https://attendance-system-rbif.onrender.com'
-        else:
-            base_url = request.host_url.rstrip('/')
-        
         # Создаем URL для сканирования с токеном
-        qr_data = f"{base_url}/scan?token={qr_token}"
+        qr_data = f"{get_base_url()}/scan?token={class_data['qr_token']}"
         
         print(f"🔗 Генерация QR-кода: {qr_data}")
         
-        # Генерируем QR-код
-        qr = qrcode.QRCode(
-            version=1,
-            error_correction=qrcode.constants.ERROR_CORRECT_H,
-            box_size=10,
-            border=4,
-        )
-        qr.add_data(qr_data)
-        qr.make(fit=True)
-        
-        img = qr.make_image(fill_color="black", back_color="white")
-        
-        # Сохраняем в буфер
-        img_buffer = io.BytesIO()
-        img.save(img_buffer, format='PNG')
-        img_buffer.seek(0)
-        
-        conn.close()
+        png = get_qr_images([qr_data])[qr_data]
         
         print(f"✅ QR-код сгенерирован для занятия ID: {class_id}")
         
         return send_file(
-            img_buffer,
+            io.BytesIO(png),
             mimetype='image/png',
             as_attachment=False,
             download_name=f'qr_code_{class_id}.png'
@@ -275,6 +849,99 @@ def generate_qr(class_id):
         print(f"❌ Ошибка генерации QR-кода: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/generate_qr_batch', methods=['GET', 'POST'])
+def generate_qr_batch():
+    """Пакетная генерация QR-кодов: PDF (страница на занятие) или ZIP с PNG/SVG"""
+    try:
+        params = request.get_json(silent=True) or request.values
+        
+        class_ids = params.get('class_ids')
+        date_from = params.get('date_from')
+        date_to = params.get('date_to')
+        output = str(params.get('format') or 'pdf').lower()
+        image_format = str(params.get('image_format') or 'png').lower()
+        
+        if output not in ('pdf', 'zip'):
+            return jsonify({'error': 'Формат должен быть pdf или zip'}), 400
+        if image_format not in ('png', 'svg'):
+            return jsonify({'error': 'Формат изображений должен быть png или svg'}), 400
+        if output == 'pdf':
+            # Страницы PDF собираются из растровых изображений
+            image_format = 'png'
+        
+        conn = get_db()
+        c = conn.cursor()
+        
+        if class_ids:
+            # Принимаем как список, так и строку "1,2,3"
+            if isinstance(class_ids, str):
+                class_ids = class_ids.split(',')
+            try:
+                class_ids = [int(class_id) for class_id in class_ids]
+            except (TypeError, ValueError):
+                conn.close()
+                return jsonify({'error': 'Неверный формат списка занятий'}), 400
+            if len(class_ids) > QR_BATCH_MAX:
+                conn.close()
+                return jsonify({'error': f'Не больше {QR_BATCH_MAX} занятий за один запрос'}), 400
+            placeholders = ','.join('?' * len(class_ids))
+            c.execute(f"SELECT * FROM classes WHERE id IN ({placeholders}) ORDER BY date_time",
+                      class_ids)
+        elif date_from and date_to:
+            c.execute('''SELECT * FROM classes
+                         WHERE date(date_time) BETWEEN date(?) AND date(?)
+                         ORDER BY date_time
+                         LIMIT ?''', (date_from, date_to, QR_BATCH_MAX + 1))
+        else:
+            conn.close()
+            return jsonify({'error': 'Укажите class_ids или date_from и date_to'}), 400
+        
+        classes = c.fetchall()
+        conn.close()
+        
+        if len(classes) > QR_BATCH_MAX:
+            return jsonify({'error': f'В периоде больше {QR_BATCH_MAX} занятий, сузьте диапазон дат'}), 400
+        
+        if not classes:
+            return jsonify({'error': 'Занятия не найдены'}), 404
+        
+        base_url = get_base_url()
+        qr_items = [f"{base_url}/scan?token={cls['qr_token']}" for cls in classes]
+        images = get_qr_images(qr_items, image_format)
+        
+        print(f"✅ Пакетно сгенерировано QR-кодов: {len(classes)} ({output})")
+        
+        buffer = io.BytesIO()
+        if output == 'pdf':
+            # Подпись на каждой странице, чтобы распечатанные коды не перепутать
+            font = get_caption_font()
+            pages = [make_qr_page(images[qr_data],
+                                  [cls['subject'], cls['date_time'].replace('T', ' ')], font)
+                     for cls, qr_data in zip(classes, qr_items)]
+            pages[0].save(buffer, format='PDF', save_all=True, append_images=pages[1:])
+            mimetype = 'application/pdf'
+            filename = 'qr_codes.pdf'
+        else:
+            # PNG уже сжат, поэтому складываем в архив без повторного сжатия
+            with zipfile.ZipFile(buffer, 'w', zipfile.ZIP_STORED) as archive:
+                for cls, qr_data in zip(classes, qr_items):
+                    name = f"qr_{cls['id']}_{cls['subject']}.{image_format}"
+                    archive.writestr(name.replace('/', '_'), images[qr_data])
+            mimetype = 'application/zip'
+            filename = 'qr_codes.zip'
+        buffer.seek(0)
+        
+        return send_file(
+            buffer,
+            mimetype=mimetype,
+            as_attachment=True,
+            download_name=filename
+        )
+        
+    except Exception as e:
+        print(f"❌ Ошибка пакетной генерации QR-кодов: {str(e)}")
+        return jsonify({'error': str(e)}), 500
+
 # ================== ОТМЕТКА ПОСЕЩАЕМОСТИ ==================
 
 @app.route('/api/mark_attendance', methods=['POST'])
@@ -294,66 +961,70 @@ def mark_attendance():
         if not token:
             return jsonify({'success': False, 'error': 'Отсутствует токен QR-кода'}), 400
         
+        # Студент из подписанной cookie, если ID не передан явно
+        session_student = session.get('student')
+        if not student_id and session_student:
+            student_id = session_student['id']
+        
         if not student_id:
             return jsonify({'success': False, 'error': 'Отсутствует ID студента'}), 400
         
+        # Закрытое занятие отклоняем без обращения к БД
+        if token in CLOSED_TOKENS:
+            return jsonify({'success': False, 'error': 'Занятие уже закрыто, отметка невозможна'}), 403
+        
         try:
             student_id = int(student_id)
         except ValueError:
             return jsonify({'success': False, 'error': 'Неверный формат ID студента'}), 400
         
-        conn = get_db()
-        c = conn.cursor()
+        # Проверяем существование токена (из кэша занятий)
+        class_dict = get_class_by_token(token)
         
-        # Проверяем существование токена
-        c.execute("SELECT * FROM classes WHERE qr_token = ?", (token,))
-        class_data = c.fetchone()
-        
-        if not class_data:
-            conn.close()
+        if not class_dict:
             print(f"❌ Токен не найден: {token}")
             return jsonify({'success': False, 'error': 'Неверный QR-код или занятие не найдено'}), 404
         
-        # Проверяем существование студента
-        c.execute("SELECT * FROM students WHERE id = ?", (student_id,))
-        student_data = c.fetchone()
+        conn = get_scan_db()
+        c = conn.cursor()
         
-        if not student_data:
-            conn.close()
-            print(f"❌ Студент не найден: {student_id}")
-            return jsonify({'success': False, 'error': 'Студент не найден'}), 404
+        # Студента из подписанной сессии повторно не проверяем (если ключ не для разработки)
+        if SESSION_TRUSTED and session_student and session_student['id'] == student_id:
+            student_dict = session_student
+        else:
+            c.execute("SELECT id, name, group_name FROM students WHERE id = ?", (student_id,))
+            student_data = c.fetchone()
+            
+            if not student_data:
+                print(f"❌ Студент не найден: {student_id}")
+                return jsonify({'success': False, 'error': 'Студент не найден'}), 404
+            
+            student_dict = dict(student_data)
+            # Cookie переподписывается только при смене студента
+            if session_student != student_dict:
+                session['student'] = student_dict
+                session.permanent = True
         
-        class_id = class_data['id']
-        scan_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        class_id = class_dict['id']
+        scan_time = local_now().strftime('%Y-%m-%d %H:%M:%S')
         
-        # Проверяем, была ли уже отметка
-        c.execute('''SELECT status FROM attendance 
-                     WHERE student_id = ? AND class_id = ?''', 
-                  (student_id, class_id))
-        existing = c.fetchone()
+        # Каждое сканирование - новое событие в журнале
+        existing = record_event(c, student_id, class_id, 'present', scan_time, 'scan',
+                                require_open=True)
         
-        student_dict = dict(student_data)
-        class_dict = dict(class_data)
+        # Занятие закрыли, пока в этом воркере еще не обновился набор закрытых токенов
+        if existing is None:
+            conn.rollback()
+            return jsonify({'success': False, 'error': 'Занятие уже закрыто, отметка невозможна'}), 403
         
         if existing:
-            # Обновляем существующую запись
-            c.execute('''UPDATE attendance 
-                         SET status = 'present', scan_time = ?
-                         WHERE student_id = ? AND class_id = ?''',
-                      (scan_time, student_id, class_id))
             message = '✅ Ваше присутствие было обновлено'
             print(f"🔄 Обновлена отметка для студента {student_id} на занятии {class_id}")
         else:
-            # Создаем новую запись
-            c.execute('''INSERT INTO attendance 
-                         (student_id, class_id, status, scan_time)
-                         VALUES (?, ?, 'present', ?)''',
-                      (student_id, class_id, scan_time))
             message = '✅ Вы успешно отметились на занятии!'
             print(f"✅ Новая отметка: студент {student_id}, занятие {class_id}")
         
         conn.commit()
-        conn.close()
         
         print(f"✅ Успешная отметка: студент {student_dict['name']}, предмет {class_dict['subject']}")
         
@@ -371,14 +1042,21 @@ def mark_attendance():
                 'date_time': class_dict['date_time']
             },
             'scan_time': scan_time,
-            'timestamp': datetime.now().isoformat()
+            'timestamp': local_now().isoformat()
         })
         
     except sqlite3.Error as e:
+        # Соединение потока постоянное: незавершенная транзакция не должна держать блокировку
+        conn = getattr(SCAN_DB, 'conn', None)
+        if conn is not None:
+            conn.rollback()
         print(f"❌ Ошибка базы данных при отметке: {str(e)}")
         return jsonify({'success': False, 'error': f'Ошибка базы данных: {str(e)}'}), 500
         
     except Exception as e:
+        conn = getattr(SCAN_DB, 'conn', None)
+        if conn is not None:
+            conn.rollback()
         print(f"❌ Неожиданная ошибка при отметке посещаемости: {str(e)}")
         return jsonify({'success': False, 'error': f'Внутренняя ошибка сервера: {str(e)}'}), 500
 
@@ -389,14 +1067,7 @@ def get_attendance(class_id):
         conn = get_db()
         c = conn.cursor()
         
-        c.execute('''SELECT s.id, s.name, s.group_name, 
-                            COALESCE(a.status, 'absent') as status,
-                            a.scan_time
-                     FROM students s
-                     LEFT JOIN attendance a ON s.id = a.student_id AND a.class_id = ?
-                     ORDER BY s.group_name, s.name''', (class_id,))
-        
-        attendance = [dict(row) for row in c.fetchall()]
+        attendance = fetch_attendance(c, class_id)
         conn.close()
         
         return jsonify(attendance)
@@ -416,25 +1087,30 @@ def update_status():
         if not all([student_id, class_id, status]):
             return jsonify({'success': False, 'error': 'Не все данные указаны'})
         
+        # В журнал событий попадают только проверенные значения: replay их воспроизводит
+        try:
+            class_id = int(class_id)
+            student_id = int(student_id)
+        except (TypeError, ValueError):
+            return jsonify({'success': False, 'error': 'Неверный формат ID студента или занятия'}), 400
+        
+        if status not in ('present', 'absent', 'late'):
+            return jsonify({'success': False, 'error': 'Неизвестный статус'}), 400
+        
         conn = get_db()
         c = conn.cursor()
         
-        # Обновляем статус
-        if status == 'present':
-            scan_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-            c.execute('''INSERT OR REPLACE INTO attendance 
-                         (student_id, class_id, status, scan_time)
-                         VALUES (?, ?, ?, ?)''',
-                      (student_id, class_id, status, scan_time))
-        else:
-            c.execute('''INSERT OR REPLACE INTO attendance 
-                         (student_id, class_id, status, scan_time)
-                         VALUES (?, ?, ?, NULL)''',
-                      (student_id, class_id, status))
+        # Обновляем статус через журнал событий
+        scan_time = local_now().strftime('%Y-%m-%d %H:%M:%S') if status == 'present' else None
+        record_event(c, student_id, class_id, status, scan_time, 'teacher')
         
         conn.commit()
         conn.close()
         
+        # Преподаватель может исправить итог закрытого занятия
+        publish_event('attendance', {'class_id': class_id, 'student_id': student_id,
+                                     'status': status, 'scan_time': scan_time})
+        
         return jsonify({'success': True, 'message': 'Статус обновлен'})
         
     except Exception as e:
@@ -457,14 +1133,7 @@ def export_csv(class_id):
             return jsonify({'error': 'Занятие не найдено'}), 404
         
         # Получаем посещаемость
-        c.execute('''SELECT s.name, s.group_name, 
-                            COALESCE(a.status, 'absent') as status,
-                            a.scan_time
-                     FROM students s
-                     LEFT JOIN attendance a ON s.id = a.student_id AND a.class_id = ?
-                     ORDER BY s.group_name, s.name''', (class_id,))
-        
-        attendance = c.fetchall()
+        attendance = fetch_attendance(c, class_id)
         conn.close()
         
         # Создаем CSV в памяти с BOM для русского Excel
@@ -500,7 +1169,7 @@ def export_csv(class_id):
         csv_data = output.getvalue().encode('utf-8-sig')
         
         # Создаем имя файла с датой
-        date_str = datetime.now().strftime('%Y%m%d_%H%M%S')
+        date_str = local_now().strftime('%Y%m%d_%H%M%S')
         filename = f'посещаемость_{class_info["subject"]}_{date_str}.csv'
         
         return send_file(
@@ -514,6 +1183,65 @@ def export_csv(class_id):
         print(f"❌ Ошибка экспорта: {str(e)}")
         return jsonify({'error': str(e)}), 500
 
+# ================== ПОИСК ==================
+
+def build_search_query(text):
+    """Преобразование строки поиска в префиксный запрос FTS5"""
+    # Каждое слово ищется по префиксу, кавычки экранируют спецсимволы FTS5
+    terms = [term for term in re.split(r'\W+', search_normalize(text)) if term]
+    return ' '.join(f'"{term}"*' for term in terms)
+
+@app.route('/api/search')
+def search():
+    """Поиск студентов и занятий по префиксу (для автодополнения)"""
+    try:
+        query = build_search_query(request.args.get('q', ''))
+        search_type = request.args.get('type', 'all')
+        
+        try:
+            # LIMIT -1 в SQLite означает "без ограничения", поэтому ограничиваем снизу
+            limit = max(1, min(int(request.args.get('limit', 20)), 100))
+        except ValueError:
+            return jsonify({'error': 'Неверный формат limit'}), 400
+        
+        if search_type not in ('all', 'students', 'classes'):
+            return jsonify({'error': 'type должен быть all, students или classes'}), 400
+        
+        result = {'students': [], 'classes': []}
+        if not query:
+            return jsonify(result)
+        
+        conn = get_db()
+        c = conn.cursor()
+        
+        # Без ORDER BY rank FTS5 останавливается на первых limit совпадениях,
+        # поэтому короткие префиксы ("а") не ранжируют всю таблицу.
+        # Занятия FTS5 отдает с конца индекса (rowid DESC), чтобы в limit попадали новые
+        if search_type in ('all', 'students'):
+            c.execute('''SELECT s.id, s.name, s.group_name
+                         FROM students_fts f
+                         JOIN students s ON s.id = f.rowid
+                         WHERE students_fts MATCH ?
+                         LIMIT ?''', (query, limit))
+            result['students'] = sorted((dict(row) for row in c.fetchall()),
+                                        key=lambda student: student['name'])
+        
+        if search_type in ('all', 'classes'):
+            c.execute('''SELECT cl.id, cl.subject, cl.date_time
+                         FROM classes_fts f
+                         JOIN classes cl ON cl.id = f.rowid
+                         WHERE classes_fts MATCH ?
+                         ORDER BY f.rowid DESC
+                         LIMIT ?''', (query, limit))
+            result['classes'] = sorted((dict(row) for row in c.fetchall()),
+                                       key=lambda cls: cls['date_time'], reverse=True)
+        
+        conn.close()
+        return jsonify(result)
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 # ================== СИСТЕМНЫЕ МАРШРУТЫ ==================
 
 @app.route('/health')
@@ -535,12 +1263,14 @@ def health_check():
         'python_version': os.environ.get('PYTHON_VERSION', 'unknown'),
         'on_render': 'RENDER' in os.environ,
         'database': db_status,
-        'timestamp': datetime.now().isoformat(),
+        'timestamp': local_now().isoformat(),
         'api_endpoints': {
             'create_class': '/api/create_class',
             'get_classes': '/api/get_classes',
             'mark_attendance': '/api/mark_attendance',
             'generate_qr': '/api/generate_qr/<class_id>',
+            'generate_qr_batch': '/api/generate_qr_batch',
+            'search': '/api/search?q=<query>',
             'health': '/health'
         }
     })
@@ -743,18 +1473,12 @@ def get_students():
 def verify_token(token):
     """Проверка валидности токена"""
     try:
-        conn = get_db()
-        c = conn.cursor()
-        
-        c.execute("SELECT id, subject, date_time FROM classes WHERE qr_token = ?", (token,))
-        class_data = c.fetchone()
-        
-        conn.close()
+        class_data = get_class_by_token(token)
         
         if class_data:
             return jsonify({
                 'valid': True,
-                'class': dict(class_data),
+                'class': class_data,
                 'message': 'Токен действителен'
             })
         else:
@@ -766,6 +1490,12 @@ def verify_token(token):
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/forget_student', methods=['POST'])
+def forget_student():
+    """Сброс запомненного студента (смена пользователя на устройстве)"""
+    session.pop('student', None)
+    return jsonify({'success': True})
+
 # ================== ЗАПУСК ПРИЛОЖЕНИЯ ==================
 
 if __name__ == '__main__':
@@ -782,6 +1512,8 @@ if __name__ == '__main__':
     print(f"   • Создание занятия: /api/create_class (POST)")
     print(f"   • Отметка посещаемости: /api/mark_attendance (POST)")
     print(f"   • Генерация QR: /api/generate_qr/<class_id>")
+    print(f"   • Пакетная генерация QR: /api/generate_qr_batch")
+    print(f"   • Поиск: /api/search?q=<запрос>")
     print(f"   • Проверка здоровья: /health")
     print(f"{'='*50}\n")
     
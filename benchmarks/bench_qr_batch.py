@@ -0,0 +1,53 @@
+"""Бенчмарк пакетной генерации QR-кодов: занятий в секунду от числа процессов пула.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_qr_batch.py [--classes 300] [--max-workers N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--classes', type=int, default=300, help='QR-кодов в пакете')
+    parser.add_argument('--max-workers', type=int,
+                        default=len(os.sched_getaffinity(0)) if hasattr(os, 'sched_getaffinity')
+                        else os.cpu_count() or 1)
+    args = parser.parse_args()
+    
+    # Временная БД и без фоновых потоков: измеряем только рендер
+    os.chdir(tempfile.mkdtemp())
+    os.environ['AUTO_CLOSE_ENABLED'] = '0'
+    import app
+    
+    qr_items = [f"https://example.com/scan?token={uuid.uuid4()}" for _ in range(args.classes)]
+    
+    print(f"{'процессов':>10} {'секунд':>8} {'занятий/с':>10}")
+    for workers in range(1, args.max_workers + 1):
+        os.environ['QR_WORKERS'] = str(workers)
+        app.QR_POOL = None
+        pool = app.get_qr_pool()
+        # Прогрев: запуск процессов пула не входит в замер
+        list(pool.map(app.render_qr, qr_items[:workers]))
+        
+        app.QR_CACHE.clear()
+        started = time.perf_counter()
+        app.get_qr_images(qr_items)
+        elapsed = time.perf_counter() - started
+        
+        pool.shutdown()
+        print(f"{workers:>10} {elapsed:>8.2f} {args.classes / elapsed:>10.1f}")
+    
+    # Повторный запрос того же пакета обслуживается из кэша
+    started = time.perf_counter()
+    app.get_qr_images(qr_items)
+    print(f"{'кэш':>10} {time.perf_counter() - started:>8.4f}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,170 @@
+"""Бенчмарк отметки студента по QR-коду через эмулированный канал 3G.
+
+Между клиентом и локальным сервером стоит TCP-прокси, который добавляет задержку
+в каждом направлении, ограничивает полосу и отдельно учитывает RTT установки
+соединения. Каждый запрос идет по новому соединению (Connection: close).
+
+Запуск из корня репозитория:
+    python benchmarks/bench_scan_3g.py [--rtt 400] [--down 400] [--up 400] [--library-kb 100]
+
+По умолчанию канал соответствует пресету "Slow 3G" Chrome DevTools
+(RTT 400 мс, 400 кбит/с). Сценарии:
+    до        - страница, затем библиотека html5-qrcode (размер задается
+                --library-kb: оценка сжатого html5-qrcode.min.js, отдается
+                локальным сервером), затем POST с ID студента
+    первый    - страница с занятием, определенным на сервере, и POST с ID студента
+    повторный - страница и POST без ID: студент берется из подписанной cookie
+"""
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+def start_proxy(target_port, rtt, down_bps, up_bps):
+    """Запуск прокси с эмуляцией канала в отдельном потоке, возвращает его порт"""
+    started = threading.Event()
+    port = []
+    
+    async def pipe(reader, writer, bps):
+        loop = asyncio.get_running_loop()
+        queue = asyncio.Queue()
+        
+        async def deliver():
+            while True:
+                deliver_at, data = await queue.get()
+                await asyncio.sleep(max(0, deliver_at - loop.time()))
+                if data is None:
+                    writer.close()
+                    return
+                writer.write(data)
+                await writer.drain()
+        
+        delivery = asyncio.create_task(deliver())
+        next_free = 0
+        while True:
+            data = await reader.read(16384)
+            # Передача занимает канал len * 8 / bps секунд, затем летит rtt / 2
+            start = max(loop.time(), next_free)
+            next_free = start + len(data) * 8 / bps
+            await queue.put((next_free + rtt / 2, data or None))
+            if not data:
+                break
+        await delivery
+    
+    async def handle(client_reader, client_writer):
+        # Установка TCP-соединения стоит один RTT
+        await asyncio.sleep(rtt)
+        server_reader, server_writer = await asyncio.open_connection('127.0.0.1', target_port)
+        await asyncio.gather(pipe(client_reader, server_writer, up_bps),
+                             pipe(server_reader, client_writer, down_bps))
+    
+    async def serve():
+        server = await asyncio.start_server(handle, '127.0.0.1', 0)
+        port.append(server.sockets[0].getsockname()[1])
+        started.set()
+        async with server:
+            await server.serve_forever()
+    
+    threading.Thread(target=lambda: asyncio.run(serve()), daemon=True).start()
+    started.wait()
+    return port[0]
+
+def request(port, method, path, body=None, cookie=None):
+    """HTTP-запрос по новому соединению: (тело ответа, Set-Cookie)"""
+    headers = {'Connection': 'close'}
+    if body is not None:
+        body = json.dumps(body)
+        headers['Content-Type'] = 'application/json'
+    if cookie:
+        headers['Cookie'] = cookie
+    conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+    conn.request(method, path, body=body, headers=headers)
+    response = conn.getresponse()
+    data = response.read()
+    set_cookie = response.getheader('Set-Cookie')
+    conn.close()
+    return data, set_cookie
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rtt', type=float, default=400, help='RTT, мс')
+    parser.add_argument('--down', type=float, default=400, help='входящая полоса, кбит/с')
+    parser.add_argument('--up', type=float, default=400, help='исходящая полоса, кбит/с')
+    parser.add_argument('--library-kb', type=int, default=100,
+                        help='размер библиотеки сканера при передаче, КБ')
+    parser.add_argument('--runs', type=int, default=5)
+    args = parser.parse_args()
+    
+    os.chdir(tempfile.mkdtemp())
+    os.environ['AUTO_CLOSE_ENABLED'] = '0'
+    os.environ.setdefault('SECRET_KEY', 'bench-secret-key')
+    import app
+    from werkzeug.serving import WSGIRequestHandler, make_server
+    
+    class QuietHandler(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+    
+    library = b'/* html5-qrcode */' + b' ' * (args.library_kb * 1024)
+    app.app.add_url_rule('/bench/html5-qrcode.js', 'bench_library',
+                         lambda: (library, 200, {'Content-Type': 'application/javascript'}))
+    
+    server = make_server('127.0.0.1', 0, app.app, threaded=True,
+                         request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = start_proxy(server.server_port, args.rtt / 1000,
+                       args.down * 1000, args.up * 1000)
+    
+    stdout = sys.stdout
+    client = app.app.test_client()
+    token = client.post('/api/create_class', data={
+        'subject': 'Бенчмарк', 'date_time': '2099-01-01T10:00'}).get_json()['qr_token']
+    
+    def flow_before():
+        request(port, 'GET', f'/scan?token={token}')
+        request(port, 'GET', '/bench/html5-qrcode.js')
+        request(port, 'POST', '/api/mark_attendance', {'token': token, 'student_id': 1})
+    
+    def flow_first():
+        request(port, 'GET', f'/scan?token={token}')
+        request(port, 'POST', '/api/mark_attendance', {'token': token, 'student_id': 1})
+    
+    # Cookie студента получена при первой отметке
+    sys.stdout = open(os.devnull, 'w')
+    cookie = request(port, 'POST', '/api/mark_attendance',
+                     {'token': token, 'student_id': 1})[1].split(';')[0]
+    sys.stdout.close()
+    sys.stdout = stdout
+    
+    def flow_repeat():
+        request(port, 'GET', f'/scan?token={token}', cookie=cookie)
+        data, _ = request(port, 'POST', '/api/mark_attendance', {'token': token}, cookie=cookie)
+        assert json.loads(data)['success']
+    
+    print(f"канал: RTT {args.rtt:.0f} мс, {args.down:.0f}/{args.up:.0f} кбит/с, "
+          f"библиотека {args.library_kb} КБ")
+    for name, flow in (('до', flow_before), ('первый', flow_first), ('повторный', flow_repeat)):
+        timings = []
+        for _ in range(args.runs):
+            sys.stdout = open(os.devnull, 'w')
+            try:
+                started = time.perf_counter()
+                flow()
+                timings.append(time.perf_counter() - started)
+            finally:
+                sys.stdout.close()
+                sys.stdout = stdout
+        print(f"{name:>10}: медиана {statistics.median(timings) * 1000:.0f} мс")
+    server.shutdown()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,143 @@
+"""Бенчмарк записи отметок при массовом сканировании: прежнее обновление на месте
+против журнала событий.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_scan_storm.py [--scans 1500] [--students 300] [--threads 1 8]
+
+Режимы:
+    inplace  - путь до журнала событий: SELECT отметки, затем UPDATE или INSERT
+               в attendance; журнал rollback, synchronous=FULL (как в исходной БД)
+    events   - record_event(): запись события и проекции, WAL + synchronous=NORMAL
+    endpoint - POST /api/mark_attendance через тестовый клиент Flask
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+LEGACY_DB = 'legacy.db'
+
+def setup_legacy_db():
+    """БД со схемой и настройками до журнала событий"""
+    conn = sqlite3.connect(LEGACY_DB)
+    conn.execute('''CREATE TABLE attendance
+                    (student_id INTEGER,
+                     class_id INTEGER,
+                     status TEXT DEFAULT 'absent',
+                     scan_time TEXT,
+                     PRIMARY KEY(student_id, class_id))''')
+    conn.commit()
+    conn.close()
+
+def scan_inplace(student_id, class_id):
+    """Отметка так, как она делалась до журнала событий"""
+    conn = sqlite3.connect(LEGACY_DB)
+    c = conn.cursor()
+    scan_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+    c.execute('''SELECT status FROM attendance
+                 WHERE student_id = ? AND class_id = ?''', (student_id, class_id))
+    if c.fetchone():
+        c.execute('''UPDATE attendance SET status = 'present', scan_time = ?
+                     WHERE student_id = ? AND class_id = ?''', (scan_time, student_id, class_id))
+    else:
+        c.execute('''INSERT INTO attendance (student_id, class_id, status, scan_time)
+                     VALUES (?, ?, 'present', ?)''', (student_id, class_id, scan_time))
+    conn.commit()
+    conn.close()
+
+def run(scan, scans, students, threads):
+    """Запуск scans отметок в threads потоках: (успешных отметок в секунду, ошибок)"""
+    per_thread = scans // threads
+    errors = []
+    
+    def worker(offset):
+        for i in range(per_thread):
+            # Студенты повторяются: часть отметок новые, часть повторные
+            try:
+                scan(1 + (offset + i) % students)
+            except sqlite3.Error:
+                # Прежний путь под конкуренцией получает "database is locked"
+                # и нарушение ключа при гонке SELECT -> INSERT
+                errors.append(1)
+    
+    workers = [threading.Thread(target=worker, args=(n * per_thread,)) for n in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    return (per_thread * threads - len(errors)) / elapsed, len(errors)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scans', type=int, default=1500)
+    parser.add_argument('--students', type=int, default=300)
+    parser.add_argument('--threads', type=int, nargs='+', default=[1, 8])
+    args = parser.parse_args()
+    
+    os.chdir(tempfile.mkdtemp())
+    os.environ['AUTO_CLOSE_ENABLED'] = '0'
+    import app
+    
+    # Студенты и занятия (по одному занятию на каждый режим и число потоков)
+    conn = app.get_db()
+    conn.executemany("INSERT OR IGNORE INTO students VALUES (?, ?, ?)",
+                     [(i, f'Студент {i}', 'Группа ИС-311') for i in range(1, args.students + 1)])
+    conn.commit()
+    conn.close()
+    setup_legacy_db()
+    
+    client = app.app.test_client()
+    
+    def new_class():
+        response = client.post('/api/create_class',
+                               data={'subject': 'Бенчмарк', 'date_time': '2099-01-01T10:00'})
+        return response.get_json()['class_id'], response.get_json()['qr_token']
+    
+    def scan_events(class_id):
+        def scan(student_id):
+            conn = app.get_db()
+            scan_time = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            app.record_event(conn.cursor(), student_id, class_id, 'present', scan_time, 'scan')
+            conn.commit()
+            conn.close()
+        return scan
+    
+    def scan_endpoint(token):
+        def scan(student_id):
+            response = client.post('/api/mark_attendance',
+                                   json={'token': token, 'student_id': student_id})
+            if response.status_code != 200:
+                raise sqlite3.OperationalError(response.get_json().get('error'))
+        return scan
+    
+    # Логи каждой отметки не должны влиять на замер
+    stdout = sys.stdout
+    print(f"{'режим':>10} {'потоков':>8} {'отметок/с':>10} {'ошибок':>8}")
+    for threads in args.threads:
+        results = {}
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            legacy_class = new_class()[0]
+            results['inplace'] = run(lambda s: scan_inplace(s, legacy_class),
+                                     args.scans, args.students, threads)
+            results['events'] = run(scan_events(new_class()[0]),
+                                    args.scans, args.students, threads)
+            results['endpoint'] = run(scan_endpoint(new_class()[1]),
+                                      args.scans, args.students, threads)
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        for mode, (rate, errors) in results.items():
+            print(f"{mode:>10} {threads:>8} {rate:>10.0f} {errors:>8}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Бенчмарк поиска /api/search: задержка p50/p99 на большой базе студентов.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_search.py [--students 100000] [--rounds 50]
+
+Цель: p99 < 10 мс при 100 тыс. студентов.
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+FIRST_NAMES = ['Алексей', 'Анна', 'Максим', 'Мария', 'Иван', 'Ольга', 'Дмитрий', 'Елена',
+               'Сергей', 'Татьяна', 'Артём', 'Юлия', 'Пётр', 'Наталья']
+LAST_NAMES = ['Пасека', 'Герасимова', 'Криворучко', 'Иванов', 'Смирнов', 'Кузнецов',
+              'Попов', 'Соколов', 'Лебедев', 'Козлов', 'Новиков', 'Морозов', 'Фёдоров']
+
+# Набор запросов автодополнения: от одной буквы до имени с фамилией и группы
+QUERIES = ['а', 'ал', 'алек', 'алексей', 'М', 'мари', 'петр', 'пётр', 'мари смир',
+           'алексей пас', 'ис', 'ис-12', 'группа ис 311', 'кузн', 'фед', 'зз']
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * share))]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--students', type=int, default=100000)
+    parser.add_argument('--rounds', type=int, default=50)
+    args = parser.parse_args()
+    
+    os.chdir(tempfile.mkdtemp())
+    os.environ['AUTO_CLOSE_ENABLED'] = '0'
+    import app
+    
+    random.seed(1)
+    conn = app.get_db()
+    conn.executemany(
+        "INSERT INTO students VALUES (?, ?, ?)",
+        [(i, f"{random.choice(FIRST_NAMES)} {random.choice(LAST_NAMES)}{i % 997}",
+          f"Группа ИС-{i % 400}") for i in range(10, args.students + 10)])
+    conn.commit()
+    conn.close()
+    
+    client = app.app.test_client()
+    timings = []
+    for _ in range(args.rounds):
+        for query in QUERIES:
+            started = time.perf_counter()
+            response = client.get('/api/search', query_string={'q': query, 'type': 'students'})
+            timings.append((time.perf_counter() - started) * 1000)
+            assert response.status_code == 200
+    
+    p99 = percentile(timings, 0.99)
+    print(f"студентов: {args.students}, запросов: {len(timings)}")
+    print(f"p50 {percentile(timings, 0.5):.2f} мс, p99 {p99:.2f} мс, "
+          f"максимум {max(timings):.2f} мс")
+    print("✅ цель p99 < 10 мс выполнена" if p99 < 10 else "❌ цель p99 < 10 мс не выполнена")
+    return 0 if p99 < 10 else 1
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,28 @@
+"""Рендер QR-кодов.
+
+Отдельный модуль без побочных эффектов при импорте: его загружают процессы
+пула пакетной генерации, которым не нужны БД и фоновые потоки app.py.
+"""
+import io
+import qrcode
+import qrcode.image.svg
+
+def render_qr(qr_data, image_format='png'):
+    """Рендер QR-кода в байты PNG или SVG"""
+    qr = qrcode.QRCode(
+        version=1,
+        error_correction=qrcode.constants.ERROR_CORRECT_H,
+        box_size=10,
+        border=4,
+    )
+    qr.add_data(qr_data)
+    qr.make(fit=True)
+    
+    img_buffer = io.BytesIO()
+    if image_format == 'svg':
+        img = qr.make_image(image_factory=qrcode.image.svg.SvgPathImage)
+        img.save(img_buffer)
+    else:
+        img = qr.make_image(fill_color="black", back_color="white")
+        img.save(img_buffer, format='PNG')
+    return img_buffer.getvalue()
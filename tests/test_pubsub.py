@@ -0,0 +1,96 @@
+"""Интеграционный тест обмена событиями между воркерами через SQLiteBroker.
+
+Два отдельных процесса импортируют app.py с общей БД: один публикует события,
+второй слушает брокер и сообщает, когда событие применено и с какой задержкой.
+"""
+import json
+import multiprocessing
+import os
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Допустимая задержка доставки: период опроса брокера (0.1 с) с большим запасом
+MAX_LATENCY = 1.0
+
+def start_app(db_dir):
+    """Импорт приложения в процессе-воркере с общей БД и без автозакрытия"""
+    os.chdir(db_dir)
+    os.environ['AUTO_CLOSE_ENABLED'] = '0'
+    os.environ.pop('PUBSUB_URL', None)
+    sys.path.insert(0, ROOT)
+    import app
+    return app
+
+def subscriber(db_dir, ready, results):
+    app = start_app(db_dir)
+    
+    def handler(payload):
+        received_at = time.time()
+        message = json.loads(payload)
+        if message['event'] == 'attendance_replayed':
+            # Итог, собранный до пересборки проекции, должен быть сброшен
+            app.CLOSED_ATTENDANCE[1] = [{'status': 'absent'}]
+        app.handle_message(payload)
+        
+        data = message['data']
+        if message['event'] == 'attendance_replayed':
+            applied = not app.CLOSED_ATTENDANCE
+        elif message['event'] == 'classes_closed':
+            applied = all(token in app.CLOSED_TOKENS for token in data['classes'].values())
+        else:
+            applied = data['class_id'] not in app.CLOSED_CLASSES
+        results.put((message['event'], applied, received_at - message['sent_at']))
+    
+    ready.set()
+    app.PUBSUB_BROKER.listen(handler)
+
+def publisher(db_dir, go, events):
+    app = start_app(db_dir)
+    go.wait()
+    for event, data in events:
+        app.publish_event(event, data)
+        time.sleep(0.05)
+
+def test_events_reach_other_worker(tmp_path):
+    context = multiprocessing.get_context('spawn')
+    ready = context.Event()
+    go = context.Event()
+    results = context.Queue()
+    
+    events = []
+    for class_id in range(1, 6):
+        events.append(('classes_closed', {'classes': {class_id: f'token-{class_id}'}}))
+    for class_id in range(1, 6):
+        events.append(('class_deleted', {'class_id': class_id}))
+    events.append(('attendance_replayed', {}))
+    
+    # БД создается заранее одним процессом, чтобы воркеры не инициализировали ее одновременно
+    init = context.Process(target=start_app, args=(str(tmp_path),))
+    init.start()
+    init.join(30)
+    
+    listener = context.Process(target=subscriber, args=(str(tmp_path), ready, results),
+                               daemon=True)
+    sender = context.Process(target=publisher, args=(str(tmp_path), go, events), daemon=True)
+    listener.start()
+    sender.start()
+    try:
+        assert ready.wait(30)
+        # Подписчик запоминает последнее сообщение при старте listen()
+        time.sleep(0.5)
+        go.set()
+        
+        received = [results.get(timeout=10) for _ in events]
+    finally:
+        listener.kill()
+        sender.kill()
+    
+    assert [event for event, _, _ in received] == [event for event, _ in events]
+    assert all(applied for _, applied, _ in received)
+    
+    latencies = sorted(latency for _, _, latency in received)
+    print(f"\nзадержка доставки: p50 {latencies[len(latencies) // 2] * 1000:.1f} мс, "
+          f"максимум {latencies[-1] * 1000:.1f} мс")
+    assert latencies[-1] < MAX_LATENCY